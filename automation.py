@@ -1,23 +1,58 @@
+from __future__ import annotations
+
 import sys
 import os
 import time
 import argparse
+import queue
+import re
+import signal
+import threading
+from collections import deque
 from datetime import datetime
 from pathlib import Path
+from typing import TYPE_CHECKING
+import warnings
 
 import serial
-import joblib
-import numpy as np
-import pandas as pd
+from sqlalchemy import insert
 
 from backend.database import get_db
 from backend.models import Telemetry
 
+# numpy/joblib (and sklearn through the pickles) are only imported when a model
+# is actually used, so --no-model starts fast and stays small on the Pi.
+if TYPE_CHECKING:
+    import numpy as np
+
 MODEL_FILE = Path('model') / 'aqua_man_model.pkl'
 SCALER_FILE = Path('model') / 'aqua_man_scaler.pkl'
 
+# Telemetry-derived features, in the order build_feature_row produces them
+FEATURE_COLUMNS = ['timestamp', 'water_level_percent', 'pump_state', 'water_volume_litres']
+
+# Pump commands understood by control.ino, pre-encoded for ser.write()
+CMD_ON = b'1'
+CMD_OFF = b'0'
+
+# Telemetry rows are committed in batches: every N readings or T seconds
+TELEMETRY_FLUSH_SIZE = 32
+TELEMETRY_FLUSH_INTERVAL = 2.0  # seconds
+# Readings kept for retry while the database is failing; beyond this the
+# oldest are dropped (about 30 minutes at the Arduino's 2 Hz). The same cap
+# applies to the queue feeding the writer while a flush is blocked.
+TELEMETRY_BUFFER_MAX = 3600
+
+# Raw serial line from the Arduino: b"<level_percent>,<pump_state>\r\n"
+ARDUINO_LINE_RE = re.compile(rb'\s*([-+]?\d+(?:\.\d*)?)\s*,\s*([-+]?\d+)')
+
+# The scaler was fitted on a DataFrame; feeding it the raw buffer is intended.
+warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
 
 def load_model_and_scaler():
+    import joblib
+
     try:
         mdl = joblib.load(MODEL_FILE)
     except FileNotFoundError:
@@ -42,57 +77,104 @@ def open_serial(port: str, baud: int, timeout: float = 1.0) -> serial.Serial:
         sys.exit(2)
 
 
-def build_feature_row(level_percent: float, pump_state: int) -> pd.DataFrame:
-    # Epoch seconds as float
-    epoch_secs = float(time.time())
-    # If volume is a required feature, derive a naive estimate from level (assume 1000L tank if unknown)
-    est_volume_l = level_percent / 100.0 * 1000.0
-    row = {
-        'timestamp': epoch_secs,
-        'water_level_percent': float(level_percent),
-        'pump_state': int(pump_state),
-        'water_volume_litres': float(est_volume_l),
-    }
-    return pd.DataFrame([row])
+def resolve_feature_layout(model, scaler):
+    """Resolves once where each telemetry feature goes in the model input row.
 
+    Returns a preallocated 1xN input buffer and a list of
+    (FEATURE_COLUMNS index, buffer column) pairs; unknown columns stay zero.
+    """
+    import numpy as np
 
-def prepare_X(df_row: pd.DataFrame, model, scaler):
-    X_use = df_row
     # Prefer scaler feature order if available
     if scaler is not None and hasattr(scaler, 'feature_names_in_'):
         feat_order = list(scaler.feature_names_in_)
-        missing = [f for f in feat_order if f not in df_row.columns]
-        if missing:
-            # For any missing features, create zeros
-            for f in missing:
-                X_use[f] = 0.0
-        X_use = X_use[feat_order]
+    else:
+        # Otherwise match model expected number of features, padding with zeros
+        expected_n = getattr(model, 'n_features_in_', len(FEATURE_COLUMNS))
+        feat_order = FEATURE_COLUMNS[:expected_n]
+        feat_order += [None] * (expected_n - len(feat_order))
+    layout = [
+        (FEATURE_COLUMNS.index(name), col)
+        for col, name in enumerate(feat_order)
+        if name in FEATURE_COLUMNS
+    ]
+    return np.zeros((1, len(feat_order)), dtype=np.float64), layout
+
+
+def build_feature_row(level_percent: float, pump_state: int, X_buf: np.ndarray, layout, epoch_secs: float) -> np.ndarray:
+    # If volume is a required feature, derive a naive estimate from level (assume 1000L tank if unknown)
+    est_volume_l = level_percent / 100.0 * 1000.0
+    row = (epoch_secs, float(level_percent), int(pump_state), float(est_volume_l))
+    for src, col in layout:
+        X_buf[0, col] = row[src]
+    return X_buf
+
+
+def make_transformer(model, scaler):
+    """Returns transform_one(level_percent, pump_state, epoch_secs) -> model input row.
+
+    Feature layout and whether the scaler applies are decided here, once,
+    so the per-reading call does no branching on model/scaler shape.
+    Standard/MinMax scalers are applied as a precomputed affine map instead
+    of going through scaler.transform() for a single row.
+    """
+    X_buf, layout = resolve_feature_layout(model, scaler)
+
+    def transform_raw(level_percent: float, pump_state: int, epoch_secs: float) -> np.ndarray:
+        return build_feature_row(level_percent, pump_state, X_buf, layout, epoch_secs)
+
+    if scaler is None or not hasattr(scaler, 'feature_names_in_'):
+        return transform_raw
+
+    import numpy as np
+
+    X_out = np.empty_like(X_buf)
+    n_features = X_buf.shape[1]
+
+    # MinMaxScaler: X * scale_ + min_, done in place on a reused output buffer
+    if type(scaler).__name__ == 'MinMaxScaler' and not getattr(scaler, 'clip', False):
+        mul = np.asarray(scaler.scale_, dtype=np.float64).reshape(1, n_features)
+        add = np.asarray(scaler.min_, dtype=np.float64).reshape(1, n_features)
+
+        def transform_minmax(level_percent: float, pump_state: int, epoch_secs: float) -> np.ndarray:
+            X_raw = build_feature_row(level_percent, pump_state, X_buf, layout, epoch_secs)
+            np.multiply(X_raw, mul, out=X_out)
+            np.add(X_out, add, out=X_out)
+            return X_out
+
+        return transform_minmax
+
+    # StandardScaler: (X - mean_) / scale_, either step may be disabled
+    if type(scaler).__name__ == 'StandardScaler':
+        mean = scaler.mean_ if getattr(scaler, 'with_mean', True) else None
+        std = scaler.scale_ if getattr(scaler, 'with_std', True) else None
+        sub = np.zeros((1, n_features)) if mean is None else np.asarray(mean, dtype=np.float64).reshape(1, n_features)
+        div = np.ones((1, n_features)) if std is None else np.asarray(std, dtype=np.float64).reshape(1, n_features)
+
+        def transform_standard(level_percent: float, pump_state: int, epoch_secs: float) -> np.ndarray:
+            X_raw = build_feature_row(level_percent, pump_state, X_buf, layout, epoch_secs)
+            np.subtract(X_raw, sub, out=X_out)
+            np.divide(X_out, div, out=X_out)
+            return X_out
+
+        return transform_standard
+
+    scale = scaler.transform
+
+    def transform_scaled(level_percent: float, pump_state: int, epoch_secs: float) -> np.ndarray:
+        X_raw = build_feature_row(level_percent, pump_state, X_buf, layout, epoch_secs)
         try:
-            X_in = scaler.transform(X_use)
-            return X_in
+            return scale(X_raw)
         except Exception as e:
             print(f"Warning: Failed to apply scaler, using raw features. Reason: {e}")
-            return X_use.values
-    # Otherwise match model expected number of features
-    expected_n = getattr(model, 'n_features_in_', X_use.shape[1])
-    if expected_n == X_use.shape[1]:
-        return X_use.values
-    # Heuristics to select subset
-    cols_priority = [
-        'timestamp', 'water_level_percent', 'pump_state', 'water_volume_litres'
-    ]
-    cols = [c for c in cols_priority if c in X_use.columns]
-    if len(cols) >= expected_n:
-        return X_use[cols[:expected_n]].values
-    # pad with zeros if model expects more
-    arr = X_use[cols].values
-    if arr.shape[1] < expected_n:
-        pad = np.zeros((arr.shape[0], expected_n - arr.shape[1]))
-        arr = np.concatenate([arr, pad], axis=1)
-    return arr
-
-
-def predict_command(model, X_in) -> str:
+            return X_raw
+
+    return transform_scaled
+
+
+def predict_command(model, X_in) -> bytes:
+    import numpy as np
+
     cmd_bool = None
     try:
         # Classification with probabilities
@@ -125,94 +207,198 @@ def predict_command(model, X_in) -> str:
     except Exception as e:
         print(f"Warning: Prediction failed, defaulting to OFF. Reason: {e}")
         cmd_bool = False
-    return '1' if cmd_bool else '0'
+    return CMD_ON if cmd_bool else CMD_OFF
+
+
+def make_predictor(model):
+    """Returns predict_one(X_in) -> CMD_ON/CMD_OFF with the model's decision rule resolved once.
 
+    Falls back to predict_command for models without predict_proba/classes_.
+    """
+    classes = list(getattr(model, 'classes_', []))
+    if not hasattr(model, 'predict_proba') or len(classes) < 2:
+        return lambda X_in: predict_command(model, X_in)
 
-def parse_arduino_line(line: str):
-    # Expected format: "level_percent,pump_state"
-    parts = [p.strip() for p in line.split(',') if p.strip() != '']
-    if len(parts) < 2:
-        raise ValueError(f"Malformed line (expected 'level,pump'): '{line}'")
-    level = float(parts[0])
-    pump_state = int(float(parts[1]))
-    return level, pump_state
+    predict_proba = model.predict_proba
+    # Binary: positive class probability is column 1; multiclass: class 1 must win argmax
+    binary = len(classes) == 2
+    pos_idx = classes.index(1) if 1 in classes else 1
+
+    def predict_one(X_in) -> bytes:
+        try:
+            proba = predict_proba(X_in)[0]
+            cmd_bool = proba[1] >= 0.5 if binary else proba.argmax() == pos_idx
+        except Exception as e:
+            print(f"Warning: Prediction failed, defaulting to OFF. Reason: {e}")
+            cmd_bool = False
+        return CMD_ON if cmd_bool else CMD_OFF
+
+    return predict_one
+
+
+def parse_arduino_line(line: bytes):
+    # Expected format: b"level_percent,pump_state"
+    m = ARDUINO_LINE_RE.match(line)
+    if m is None:
+        raise ValueError(f"Malformed line (expected 'level,pump'): {line!r}")
+    return float(m.group(1)), int(m.group(2))
 
 def no_model_command(
     current_level: float,
     current_pump_state: int,
     previous_command = None,
-) -> str:
+) -> bytes:
     if current_level <= 6.0:
-        return "1"
+        return CMD_ON
     if current_level >= 99.0:
-        return "0"
+        return CMD_OFF
     if previous_command is not None:
         return previous_command
-    return "1" if current_pump_state else "0"
+    return CMD_ON if current_pump_state else CMD_OFF
+
+def flush_telemetry(db, pending: deque) -> bool:
+    """Commits the pending rows; returns False (keeping them) if the commit failed."""
+    if not pending:
+        return True
+    try:
+        # One executemany over plain parameter rows; no ORM objects per reading
+        db.execute(insert(Telemetry), [
+            {'timestamp': ts, 'water_level_percent': level, 'pump_state': pump_state}
+            for ts, level, pump_state in pending
+        ])
+        db.commit()
+    except Exception as store_exc:
+        # Keep the rows for the next flush; the bounded buffer sheds the oldest
+        print(f"Warning: Failed to persist telemetry ({len(pending)} readings buffered): {store_exc}")
+        db.rollback()
+        return False
+    pending.clear()
+    return True
+
+def queue_telemetry(rows: queue.Queue, row) -> None:
+    """Hands a reading to the writer, dropping the oldest queued one if the queue is full."""
+    while True:
+        try:
+            rows.put_nowait(row)
+            return
+        except queue.Full:
+            try:
+                rows.get_nowait()
+            except queue.Empty:
+                pass
+
+def run_telemetry_writer(rows: queue.Queue) -> None:
+    """Commits (timestamp, level, pump_state) tuples from the queue in batches until a None sentinel arrives.
+
+    Runs on its own thread so database commits never delay reading the serial
+    port or answering the Arduino.
+    """
+    db_gen = get_db()
+    db = next(db_gen)
+    pending = deque(maxlen=TELEMETRY_BUFFER_MAX)
+    last_flush = time.monotonic()
+    # After a failed flush the batch stays full; retry on the interval only,
+    # not on every new reading
+    healthy = True
+    try:
+        while True:
+            try:
+                row = rows.get(timeout=TELEMETRY_FLUSH_INTERVAL)
+            except queue.Empty:
+                healthy = flush_telemetry(db, pending)
+                last_flush = time.monotonic()
+                continue
+            if row is None:
+                break
+            pending.append(row)
+            if (healthy and len(pending) >= TELEMETRY_FLUSH_SIZE) or time.monotonic() - last_flush >= TELEMETRY_FLUSH_INTERVAL:
+                healthy = flush_telemetry(db, pending)
+                last_flush = time.monotonic()
+    finally:
+        flush_telemetry(db, pending)
+        try:
+            # Close the database generator to trigger cleanup
+            next(db_gen)
+        except StopIteration:
+            pass
+        except Exception:
+            pass
 
 def main():
     parser = argparse.ArgumentParser(description='AquaMan automation: model-driven pump control over Arduino serial')
     parser.add_argument('--port', default=os.environ.get('AQUA_SERIAL_PORT', '/dev/ttyUSB0'), help='Serial port (e.g., COM3 or /dev/ttyACM0)')
     parser.add_argument('--baud', default=int(os.environ.get('AQUA_SERIAL_BAUD', '9600')), type=int, help='Baud rate (default 9600)')
-    parser.add_argument('--interval', default=0.1, type=float, help='Loop sleep interval in seconds')
+    parser.add_argument('--interval', default=1.0, type=float, help='Serial read timeout in seconds; telemetry is still flushed while the port is idle')
     parser.add_argument('--dry-run', action='store_true', help='Do not send commands to Arduino, only print decisions')
     parser.add_argument('--no-model', action='store_true', help='Use simple control; skip ML model')
     args = parser.parse_args()
 
+    # The control mode never changes at runtime, so pick the decision function once
     if args.no_model:
         print("Running in NM mode: Thresholds (6%, 99%)")
+
+        def decide(level, pump_state, now, last_command):
+            return no_model_command(level, pump_state, last_command)
     else:
         model, scaler = load_model_and_scaler()
+        transform_one = make_transformer(model, scaler)
+        predict_one = make_predictor(model)
 
-    # Initialize database session
-    db_gen = get_db()
-    db = next(db_gen)
-    ser = open_serial(args.port, args.baud, timeout=1.0)
+        def decide(level, pump_state, now, last_command):
+            return predict_one(transform_one(level, pump_state, now))
+
+    ser = open_serial(args.port, args.baud, timeout=args.interval)
+    # Telemetry is stored by a background writer thread
+    telemetry_rows = queue.Queue(maxsize=TELEMETRY_BUFFER_MAX)
+    writer = threading.Thread(target=run_telemetry_writer, args=(telemetry_rows,), name='telemetry-writer', daemon=True)
+    writer.start()
     last_command = None
+    partial = b''
+    # Options read on every reading, bound once as locals
+    dry_run = args.dry_run
+    # Per-reading status lines are for someone watching; headless runs (service,
+    # redirected stdout) skip them unless AQUA_STATUS=1
+    show_status = sys.stdout.isatty() or os.environ.get('AQUA_STATUS') == '1'
+
+    # SIGTERM (service stop) exits through the same path as Ctrl+C, right away
+    # and with queued telemetry committed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
     print('Beginning operation. Press Ctrl+C to exit.')
     try:
         while True:
             try:
-                if ser.in_waiting > 0:
-                    line = ser.readline().decode('utf-8', errors='ignore').strip()
-                    if not line:
-                        time.sleep(args.interval)
-                        continue
+                # Block on the port until a line arrives. A read that times out
+                # mid-line returns only its head, which is held back and joined
+                # with the rest; parsing the pieces separately could turn
+                # b"52.34,0" into a reading of 4%.
+                chunk = ser.readline()
+                if not chunk.endswith(b'\n'):
+                    partial += chunk
+                    continue
+                line, partial = partial + chunk, b''
+                if line.strip():
                     try:
                         level, pump_state = parse_arduino_line(line)
                     except Exception as pe:
-                        print(f"Skip malformed line: {line} ({pe})")
+                        print(f"Skip malformed line: {line.decode('utf-8', errors='ignore').strip()} ({pe})")
                         continue
 
-                    df_row = build_feature_row(level, pump_state)
-                    if args.no_model:
-                        cmd = no_model_command(level, pump_state, last_command)
-                    else:
-                        X_in = prepare_X(df_row, model, scaler)
-                        cmd = predict_command(model, X_in)
+                    # One clock read per reading, shared by features, storage and logging
+                    now = time.time()
+                    cmd = decide(level, pump_state, now, last_command)
                     last_command = cmd
 
-                    if not args.dry_run:
+                    # The Arduino reports its relay state on every line, so only
+                    # send a command that would change it
+                    if not dry_run and cmd != (CMD_ON if pump_state else CMD_OFF):
                         try:
-                            ser.write(cmd.encode('utf-8'))
+                            ser.write(cmd)
                         except Exception as we:
                             print(f"Warning: Failed to write to serial: {we}")
-                    try:
-                        telemetry_entry = Telemetry(
-                            timestamp=datetime.utcnow(),
-                            water_level_percent=level,
-                            pump_state=pump_state
-                        )
-                        db.add(telemetry_entry)
-                        db.commit()
-                    except Exception as store_exc:
-                        print(f"Warning: Failed to persist telemetry: {store_exc}")
-                        db.rollback()
-                    now = time.strftime('%H:%M:%S')
-                    print(f"{now} level%: {level:.2f}, pump_state: {pump_state}, cmd: {cmd}")
-                else:
-                    time.sleep(args.interval)
+                    queue_telemetry(telemetry_rows, (datetime.utcfromtimestamp(now), level, pump_state))
+                    if show_status:
+                        print(f"{time.strftime('%H:%M:%S', time.localtime(now))} level%: {level:.2f}, pump_state: {pump_state}, cmd: {cmd.decode()}")
             except Exception as e:
                 print(f"An error occurred in loop: {e}")
                 time.sleep(1.0)
@@ -223,13 +409,9 @@ def main():
             ser.close()
         except Exception:
             pass
-        try:
-            # Close the database generator to trigger cleanup
-            next(db_gen)
-        except StopIteration:
-            pass
-        except Exception:
-            pass
+        # Let the writer commit whatever is still queued
+        telemetry_rows.put(None)
+        writer.join()
 
 
 if __name__ == '__main__':
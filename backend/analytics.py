@@ -0,0 +1,205 @@
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import Integer, case, cast, func, select
+from sqlalchemy.orm import Session
+
+from . import models
+
+LITERS_PER_PERCENT = 10.0  # 1000L tank / 100%
+
+
+def _usage_slice(percent: float) -> dict:
+    return {"percent": percent, "liters": percent * LITERS_PER_PERCENT}
+
+
+def usage_steps(since: Optional[datetime] = None, upto_id: Optional[int] = None):
+    """Subquery with one row per reading and the usage attributed to it.
+
+    Usage is the level drop since the previous reading, counted only when the
+    pump is OFF. LAG() pairs consecutive readings inside the database, after
+    the optional filters, so with `since` both readings of a pair lie inside
+    the window.
+    """
+    T = models.Telemetry
+    order = (T.timestamp, T.id)
+    prev_level = func.lag(T.water_level_percent).over(order_by=order)
+    stmt = select(
+        T.timestamp.label("timestamp"),
+        case(
+            ((T.pump_state == 0) & (prev_level > T.water_level_percent), prev_level - T.water_level_percent),
+            else_=0.0,
+        ).label("usage"),
+    )
+    if since is not None:
+        stmt = stmt.where(T.timestamp >= since)
+    if upto_id is not None:
+        stmt = stmt.where(T.id <= upto_id)
+    return stmt.subquery()
+
+
+@dataclass
+class _AllTimeTotals:
+    """All-time aggregates up to last_id, advanced with each build's new rows."""
+
+    last_id: int
+    last_timestamp: datetime
+    last_level: float
+    pump_counts: dict  # pump_state -> readings
+    daily_usage: dict  # "YYYY-MM-DD" -> usage percent
+
+
+# Each dashboard build only reads the rows added since the previous one, so the
+# per-request cost stays independent of the history length. Sync routes run on
+# the threadpool, hence the lock.
+_totals_lock = threading.Lock()
+_totals = None
+
+
+def _seed_totals(db: Session) -> Optional[_AllTimeTotals]:
+    T = models.Telemetry
+    # Pin the snapshot to the ids present now; rows inserted meanwhile are
+    # picked up by the next incremental pass
+    last_id = db.scalar(select(func.max(T.id)))
+    if last_id is None:
+        return None
+    steps = usage_steps(upto_id=last_id)
+    day = func.date(steps.c.timestamp)
+    last = db.execute(
+        select(T.timestamp, T.water_level_percent)
+        .where(T.id <= last_id)
+        .order_by(T.timestamp.desc(), T.id.desc())
+        .limit(1)
+    ).one()
+    return _AllTimeTotals(
+        last_id=last_id,
+        last_timestamp=last.timestamp,
+        last_level=last.water_level_percent,
+        pump_counts=dict(
+            db.execute(select(T.pump_state, func.count()).where(T.id <= last_id).group_by(T.pump_state)).all()
+        ),
+        daily_usage=dict(
+            db.execute(select(day, func.sum(steps.c.usage)).where(steps.c.usage > 0).group_by(day)).all()
+        ),
+    )
+
+
+def _advance_totals(db: Session, totals: _AllTimeTotals) -> bool:
+    """Folds rows newer than last_id into totals; False if they have to be rebuilt."""
+    T = models.Telemetry
+    new_rows = db.execute(
+        select(T.id, T.timestamp, T.water_level_percent, T.pump_state)
+        .where(T.id > totals.last_id)
+        .order_by(T.timestamp, T.id)
+    ).all()
+    if not new_rows:
+        return True
+    if new_rows[0].timestamp < totals.last_timestamp:
+        return False  # a back-dated reading changes earlier pairs
+    last_level = totals.last_level
+    pump_counts, days = totals.pump_counts, totals.daily_usage
+    for row in new_rows:
+        level = row.water_level_percent
+        pump_counts[row.pump_state] = pump_counts.get(row.pump_state, 0) + 1
+        if row.pump_state == 0 and last_level > level:
+            day = row.timestamp.date().isoformat()
+            days[day] = days.get(day, 0.0) + (last_level - level)
+        last_level = level
+    totals.last_id = max(r.id for r in new_rows)
+    totals.last_timestamp = new_rows[-1].timestamp
+    totals.last_level = last_level
+    return True
+
+
+def all_time_totals(db: Session):
+    """Returns (pump state counts, usage percent per day) over the whole history."""
+    global _totals
+    with _totals_lock:
+        if _totals is None or not _advance_totals(db, _totals):
+            _totals = _seed_totals(db)
+        if _totals is None:
+            return {}, {}
+        return dict(_totals.pump_counts), dict(_totals.daily_usage)
+
+
+def build_dashboard_metrics(db: Session, now: datetime) -> dict:
+    """Aggregates the telemetry table into dashboard metrics.
+
+    Returns a plain dict shaped like schemas.DashboardMetrics, ready to be
+    JSON-encoded without a per-field validation pass.
+    """
+    T = models.Telemetry
+    day_ago = now - timedelta(days=1)
+
+    # Water levels (last 24h for graph); the newest of them doubles as the
+    # latest reading, so the table is only probed again when the window is empty
+    columns = (T.timestamp, T.water_level_percent, T.pump_state)
+    recent = db.execute(select(*columns).where(T.timestamp >= day_ago).order_by(T.timestamp, T.id)).all()
+    latest = recent[-1] if recent else db.execute(select(*columns).order_by(T.timestamp.desc()).limit(1)).first()
+    if not latest:
+        # Return empty structure
+        return {
+            "latest": None,
+            "sample_count": 0,
+            "usage": {
+                "last_24h": {"percent": 0.0, "liters": 0.0},
+                "all_time": {"percent": 0.0, "liters": 0.0},
+                "per_hour": [],
+                "per_day": [],
+            },
+            "water_levels": [],
+            "pump_state_summary": {"on": 0, "off": 0},
+            "leak_events": 0,
+        }
+
+    # Pump state summary and per day usage (all time)
+    pump_counts, daily_usage = all_time_totals(db)
+    per_day_usage = [{"date": d, **_usage_slice(p)} for d, p in sorted(daily_usage.items())]
+
+    # Per hour usage (last 24h, both readings of a pair inside the window),
+    # listed in order of first occurrence
+    steps = usage_steps(since=day_ago)
+    hour = cast(func.strftime("%H", steps.c.timestamp), Integer)
+    per_hour_usage = [
+        {"hour": h, **_usage_slice(p)}
+        for h, p in db.execute(
+            select(hour, func.sum(steps.c.usage))
+            .where(steps.c.usage > 0)
+            .group_by(hour)
+            .order_by(func.min(steps.c.timestamp))
+        )
+    ]
+
+    water_levels = [
+        {
+            "timestamp": r.timestamp,
+            "water_level_percent": r.water_level_percent,
+            "water_level_liters": r.water_level_percent * LITERS_PER_PERCENT,
+        }
+        for r in recent
+    ]
+
+    return {
+        "latest": {
+            "timestamp": latest.timestamp,
+            "water_level_percent": latest.water_level_percent,
+            "pump_state": latest.pump_state,
+            "leak_detected": False,  # Placeholder
+            "water_level_liters": latest.water_level_percent * LITERS_PER_PERCENT,
+        },
+        "sample_count": sum(pump_counts.values()),
+        "usage": {
+            "last_24h": _usage_slice(sum(h["percent"] for h in per_hour_usage)),
+            "all_time": _usage_slice(sum(d["percent"] for d in per_day_usage)),
+            "per_hour": per_hour_usage,
+            "per_day": per_day_usage,
+        },
+        "water_levels": water_levels,
+        "pump_state_summary": {
+            "on": pump_counts.get(1, 0),
+            "off": pump_counts.get(0, 0),
+        },
+        "leak_events": 0,
+    }
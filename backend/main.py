@@ -1,19 +1,38 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from fastapi import Body, FastAPI, Depends, HTTPException, Request, Response, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBasic, HTTPBasicCredentials, HTTPBearer
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import func, insert, select
 from sqlalchemy.orm import Session
 from passlib.context import CryptContext
-from datetime import datetime, timedelta
-from typing import List
+from datetime import datetime, timezone
+from typing import Annotated, List
+import base64
+import hashlib
+import hmac
+import os
 import secrets
+import threading
+import time
 
-from . import models, schemas
+import orjson
+
+from . import analytics, models, schemas
 from .database import SessionLocal, engine, get_db
 
 # Create database tables
 models.Base.metadata.create_all(bind=engine)
+# create_all() only builds indexes with new tables; add any missing ones to existing databases
+for index in models.Telemetry.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
+
+class ORJSONResponse(JSONResponse):
+    """JSON response encoded with orjson (native datetime and numpy support)."""
 
-app = FastAPI(title="Water Tank Management API")
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+app = FastAPI(title="Water Tank Management API", default_response_class=ORJSONResponse)
 
 # --- CORS Middleware ---
 # Allows the Next.js frontend to communicate with this backend
@@ -21,13 +40,18 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],  # Adjust for your frontend URL
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Authorization", "Content-Type", "If-None-Match"],
+    max_age=600,  # let browsers reuse preflight results for 10 minutes
 )
 
 # --- Authentication ---
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-security = HTTPBasic()
+# bcrypt cost for new hashes (2^rounds iterations). Existing hashes keep the cost they
+# were created with. Low-powered deployments such as a Raspberry Pi can lower it.
+BCRYPT_ROUNDS = int(os.environ.get("WATERTANK_BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+security = HTTPBasic(auto_error=False)
+bearer = HTTPBearer(auto_error=False)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -35,14 +59,97 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def get_current_user(credentials: HTTPBasicCredentials = Depends(security), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == credentials.username).first()
-    if not user or not verify_password(credentials.password, user.hashed_password):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect username or password",
-            headers={"WWW-Authenticate": "Basic"},
-        )
+def authenticate_user(db: Session, username: str, password: str):
+    """Returns the user if the credentials are valid, otherwise None."""
+    user = db.query(models.User).filter(models.User.username == username).first()
+    if not user:
+        # Burn a bcrypt verify anyway so unknown usernames take as long as bad passwords
+        pwd_context.dummy_verify()
+        return None
+    if not verify_password(password, user.hashed_password):
+        return None
+    return user
+
+# bcrypt is slow by design and the dashboard re-sends Basic credentials on
+# every poll, so successful verifications are remembered for a short while.
+AUTH_CACHE_TTL = 30.0  # seconds
+AUTH_CACHE_MAX_ENTRIES = 1024
+_auth_cache = {}  # (username, sha256(password)) -> (expires_at, user_id)
+# Sync dependencies run on the threadpool; pruning and storing happen under the lock
+_auth_cache_lock = threading.Lock()
+
+def _prune_auth_cache(now):
+    for key in [k for k, (expires_at, _) in _auth_cache.items() if expires_at <= now]:
+        del _auth_cache[key]
+    if len(_auth_cache) >= AUTH_CACHE_MAX_ENTRIES:
+        _auth_cache.clear()
+
+# Login hands out a signed token so clients can skip bcrypt on every request.
+# Tokens are "<user_id>.<expires_at>.<signature>" with an HMAC-SHA256 signature.
+# Without WATERTANK_SECRET_KEY a random key is used and tokens die with the process.
+TOKEN_SECRET = os.environ.get("WATERTANK_SECRET_KEY", "").encode("utf-8") or secrets.token_bytes(32)
+TOKEN_TTL = 12 * 60 * 60  # seconds
+
+def _sign(payload: str) -> bytes:
+    digest = hmac.new(TOKEN_SECRET, payload.encode("utf-8", "surrogateescape"), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=")
+
+def create_access_token(user_id: int) -> str:
+    payload = f"{user_id}.{int(time.time()) + TOKEN_TTL}"
+    return f"{payload}.{_sign(payload).decode('ascii')}"
+
+def read_access_token(token: str):
+    """Returns the user id from a valid, unexpired token, otherwise None."""
+    payload, _, signature = token.rpartition(".")
+    # Compared as bytes: compare_digest rejects str with non-ASCII characters
+    if not hmac.compare_digest(signature.encode("utf-8", "surrogateescape"), _sign(payload)):
+        return None
+    user_id, _, expires_at = payload.partition(".")
+    try:
+        if int(expires_at) < time.time():
+            return None
+        return int(user_id)
+    except ValueError:
+        return None
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Basic"},
+    )
+
+def get_current_user(
+    credentials: HTTPBasicCredentials = Depends(security),
+    token: HTTPAuthorizationCredentials = Depends(bearer),
+    db: Session = Depends(get_db),
+):
+    """Accepts either a Bearer token from /users/login or HTTP Basic credentials."""
+    if token:
+        user_id = read_access_token(token.credentials)
+        user = db.get(models.User, user_id) if user_id is not None else None
+        if not user:
+            raise _unauthorized("Invalid or expired token")
+        return user
+    if not credentials:
+        raise _unauthorized("Not authenticated")
+
+    now = time.monotonic()
+    cache_key = (credentials.username, hashlib.sha256(credentials.password.encode("utf-8")).digest())
+    cached = _auth_cache.get(cache_key)
+    if cached and cached[0] > now:
+        user = db.get(models.User, cached[1])
+        if user:
+            return user
+
+    user = authenticate_user(db, credentials.username, credentials.password)
+    if not user:
+        raise _unauthorized("Incorrect username or password")
+
+    with _auth_cache_lock:
+        if len(_auth_cache) >= AUTH_CACHE_MAX_ENTRIES:
+            _prune_auth_cache(now)
+        _auth_cache[cache_key] = (now + AUTH_CACHE_TTL, user.id)
     return user
 
 # --- API Routes ---
@@ -61,10 +168,15 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
 
 @app.post("/users/login")
 def login(user_login: schemas.UserCreate, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == user_login.username).first()
-    if not user or not verify_password(user_login.password, user.hashed_password):
+    user = authenticate_user(db, user_login.username, user_login.password)
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    return {"username": user.username, "last_login": None}
+    return {
+        "username": user.username,
+        "last_login": None,
+        "token": create_access_token(user.id),
+        "token_type": "bearer",
+    }
 
 @app.get("/users/me", response_model=schemas.User)
 def read_users_me(current_user: models.User = Depends(get_current_user)):
@@ -74,127 +186,111 @@ def read_users_me(current_user: models.User = Depends(get_current_user)):
 @app.post("/telemetry/", response_model=schemas.Telemetry, status_code=status.HTTP_201_CREATED)
 def create_telemetry_reading(telemetry: schemas.TelemetryCreate, db: Session = Depends(get_db)):
     """Endpoint for automation.py to post new data."""
-    db_telemetry = models.Telemetry(**telemetry.model_dump())
-    db.add(db_telemetry)
+    data = telemetry.model_dump()
+    if not engine.dialect.insert_returning:
+        # SQLite older than 3.35 (e.g. Raspberry Pi OS Bullseye) has no RETURNING
+        db_telemetry = models.Telemetry(**data)
+        db.add(db_telemetry)
+        db.commit()
+        db.refresh(db_telemetry)
+        return db_telemetry
+    # Core INSERT ... RETURNING: no unit-of-work flush and no refresh SELECT for the server-side defaults
+    row = db.execute(
+        insert(models.Telemetry).values(**data).returning(models.Telemetry.id, models.Telemetry.timestamp)
+    ).one()
     db.commit()
-    db.refresh(db_telemetry)
-    return db_telemetry
+    return {**data, "id": row.id, "timestamp": row.timestamp}
+
+TELEMETRY_BATCH_MAX = 1000
+
+def _as_utc_naive(ts: datetime) -> datetime:
+    # Stored timestamps are naive UTC, like the server default
+    return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts
+
+@app.post("/telemetry/batch", status_code=status.HTTP_201_CREATED)
+def create_telemetry_batch(
+    readings: Annotated[List[schemas.TelemetryBatchItem], Body(max_length=TELEMETRY_BATCH_MAX)],
+    db: Session = Depends(get_db),
+):
+    """Bulk variant of POST /telemetry/ for clients that buffer readings: one INSERT and one commit.
+
+    Each reading may carry the time it was taken; readings without one get the
+    time of the request.
+    """
+    if readings:
+        now = datetime.utcnow().replace(microsecond=0)
+        db.execute(insert(models.Telemetry), [
+            {
+                "water_level_percent": r.water_level_percent,
+                "pump_state": r.pump_state,
+                "timestamp": _as_utc_naive(r.timestamp) if r.timestamp else now,
+            }
+            for r in readings
+        ])
+        db.commit()
+    return {"inserted": len(readings)}
+
+HISTORY_CHUNK_ROWS = 500
+
+def _stream_history(skip: int, limit: int):
+    """Yields the history page as a JSON array, encoding HISTORY_CHUNK_ROWS rows at a time."""
+    # Own session: the request's one may be closed before the body is fully sent
+    db = SessionLocal()
+    try:
+        T = models.Telemetry
+        result = db.execute(
+            select(T.water_level_percent, T.pump_state, T.id, T.timestamp)
+            .order_by(T.timestamp.desc())
+            .offset(skip)
+            .limit(limit)
+            .execution_options(yield_per=HISTORY_CHUNK_ROWS)
+        )
+        yield b"["
+        separator = b""
+        for rows in result.partitions():
+            if rows:
+                yield separator + orjson.dumps([row._asdict() for row in rows])[1:-1]
+                separator = b","
+        yield b"]"
+    finally:
+        db.close()
 
 @app.get("/telemetry/history", response_model=List[schemas.Telemetry])
-def get_telemetry_history(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_telemetry_history(skip: int = 0, limit: int = 100, current_user: models.User = Depends(get_current_user)):
     """Get historical data for graphs."""
-    return db.query(models.Telemetry).order_by(models.Telemetry.timestamp.desc()).offset(skip).limit(limit).all()
+    # Rows come straight from the table, so skip response_model validation and stream them out
+    return StreamingResponse(_stream_history(skip, limit), media_type="application/json")
+
+# --- Dashboard cache ---
+# Metrics change when telemetry rows are added, and as the 24h window slides. The
+# last encoded response body is reused while the highest row id stays the same, for
+# at most DASHBOARD_CACHE_TTL seconds. max(id) is a single index probe, so unchanged
+# polls stay cheap however long the history grows (no route deletes telemetry).
+# Keying on the table rather than clearing on POST also catches rows that
+# automation.py writes to the database directly.
+DASHBOARD_CACHE_TTL = 60  # seconds
+_dashboard_cache = (None, None)
 
 @app.get("/dashboard/metrics", response_model=schemas.DashboardMetrics)
-def get_dashboard_metrics(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_dashboard_metrics(request: Request, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     """Provides aggregated data for the dashboard UI."""
-    
-    LITERS_PER_PERCENT = 10.0 # 1000L tank / 100%
-
-    # Get latest reading
-    latest = db.query(models.Telemetry).order_by(models.Telemetry.timestamp.desc()).first()
-    
-    # Get all readings for calculations (optimize this in production)
-    all_readings = db.query(models.Telemetry).order_by(models.Telemetry.timestamp.asc()).all()
-    
-    if not latest:
-        # Return empty structure
-        empty_usage = schemas.DashboardUsage(
-            last_24h=schemas.DashboardUsageSlice(percent=0, liters=0),
-            all_time=schemas.DashboardUsageSlice(percent=0, liters=0),
-            per_hour=[],
-            per_day=[]
-        )
-        return schemas.DashboardMetrics(
-            latest=None,
-            sample_count=0,
-            usage=empty_usage,
-            water_levels=[],
-            pump_state_summary=schemas.DashboardPumpStateSummary(on=0, off=0),
-            leak_events=0
-        )
+    global _dashboard_cache
 
-    # Helper to calculate usage
-    def calculate_usage(readings):
-        usage_percent = 0.0
-        for r_prev, r_curr in zip(readings, readings[1:]):
-            # Only count drops when pump is OFF
-            if r_curr.pump_state == 0 and r_prev.water_level_percent > r_curr.water_level_percent:
-                usage_percent += (r_prev.water_level_percent - r_curr.water_level_percent)
-        return usage_percent
-
-    # 24-hour usage
-    day_ago = datetime.utcnow() - timedelta(days=1)
-    readings_24h = [r for r in all_readings if r.timestamp >= day_ago]
-    usage_24h_percent = calculate_usage(readings_24h)
-    
-    # All-time usage
-    usage_all_time_percent = calculate_usage(all_readings)
-
-    # Per hour usage (last 24h)
-    usage_by_hour = {}
-    for r_prev, r_curr in zip(readings_24h, readings_24h[1:]):
-        if r_curr.pump_state == 0 and r_prev.water_level_percent > r_curr.water_level_percent:
-            hour = r_curr.timestamp.hour
-            diff = r_prev.water_level_percent - r_curr.water_level_percent
-            usage_by_hour[hour] = usage_by_hour.get(hour, 0.0) + diff
-            
-    per_hour_usage = [
-        schemas.UsagePerHour(hour=h, percent=p, liters=p * LITERS_PER_PERCENT)
-        for h, p in usage_by_hour.items()
-    ]
-
-    # Per day usage (all time)
-    usage_by_day = {}
-    for r_prev, r_curr in zip(all_readings, all_readings[1:]):
-        if r_curr.pump_state == 0 and r_prev.water_level_percent > r_curr.water_level_percent:
-            date_str = r_curr.timestamp.strftime('%Y-%m-%d')
-            diff = r_prev.water_level_percent - r_curr.water_level_percent
-            usage_by_day[date_str] = usage_by_day.get(date_str, 0.0) + diff
-
-    per_day_usage = [
-        schemas.UsagePerDay(date=d, percent=p, liters=p * LITERS_PER_PERCENT)
-        for d, p in usage_by_day.items()
-    ]
-    
-    # Pump state summary
-    pump_on_count = sum(1 for r in all_readings if r.pump_state == 1)
-    pump_off_count = sum(1 for r in all_readings if r.pump_state == 0)
-
-    # Water levels (last 24h for graph)
-    water_levels = [
-        schemas.DashboardWaterLevel(
-            timestamp=r.timestamp,
-            water_level_percent=r.water_level_percent,
-            water_level_liters=r.water_level_percent * LITERS_PER_PERCENT
-        ) for r in readings_24h
-    ]
-
-    return schemas.DashboardMetrics(
-        latest=schemas.DashboardLatest(
-            timestamp=latest.timestamp,
-            water_level_percent=latest.water_level_percent,
-            pump_state=latest.pump_state,
-            leak_detected=False, # Placeholder
-            water_level_liters=latest.water_level_percent * LITERS_PER_PERCENT
-        ),
-        sample_count=len(all_readings),
-        usage=schemas.DashboardUsage(
-            last_24h=schemas.DashboardUsageSlice(
-                percent=usage_24h_percent, 
-                liters=usage_24h_percent * LITERS_PER_PERCENT
-            ),
-            all_time=schemas.DashboardUsageSlice(
-                percent=usage_all_time_percent, 
-                liters=usage_all_time_percent * LITERS_PER_PERCENT
-            ),
-            per_hour=per_hour_usage,
-            per_day=per_day_usage
-        ),
-        water_levels=water_levels,
-        pump_state_summary=schemas.DashboardPumpStateSummary(
-            on=pump_on_count,
-            off=pump_off_count
-        ),
-        leak_events=0
-    )
+    max_id = db.scalar(select(func.max(models.Telemetry.id)))
+    window = int(time.time() // DASHBOARD_CACHE_TTL)
+    cache_key = (max_id, window)
+    # Clients polling with If-None-Match get a bodiless 304 until telemetry changes
+    etag = f'"{max_id or 0:x}-{window:x}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    cached_key, body = _dashboard_cache
+    if cached_key != cache_key:
+        # Already shaped like DashboardMetrics; encode once and serve the bytes until it changes
+        body = ORJSONResponse(content=build_dashboard_metrics(db)).body
+        _dashboard_cache = (cache_key, body)
+    return Response(content=body, media_type="application/json", headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+def build_dashboard_metrics(db: Session) -> dict:
+    """Aggregates the telemetry table for the dashboard."""
+    return analytics.build_dashboard_metrics(db, datetime.utcnow())
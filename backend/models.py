@@ -13,6 +13,6 @@ class Telemetry(Base):
     __tablename__ = "telemetry"
 
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, server_default=func.now())
+    timestamp = Column(DateTime, server_default=func.now(), index=True)
     water_level_percent = Column(Float, nullable=False)
     pump_state = Column(Integer, nullable=False)
\ No newline at end of file
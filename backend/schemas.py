@@ -1,5 +1,5 @@
 from typing import List, Optional, Dict
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from datetime import datetime
 
 class TelemetryBase(BaseModel):
@@ -9,12 +9,15 @@ class TelemetryBase(BaseModel):
 class TelemetryCreate(TelemetryBase):
     pass
 
+class TelemetryBatchItem(TelemetryCreate):
+    # When the reading was taken; omitted means the time of the request
+    timestamp: Optional[datetime] = None
+
 class Telemetry(TelemetryBase):
     id: int
     timestamp: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class UserBase(BaseModel):
     username: str
@@ -25,8 +28,7 @@ class UserCreate(UserBase):
 class User(UserBase):
     id: int
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class DashboardUsageSlice(BaseModel):
     percent: float
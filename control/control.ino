@@ -10,10 +10,18 @@
 #define MIN_DISTANCE 4
 #define MAX_DISTANCE 11
 
+// Level gained per cm the water surface rises; avoids a float division per sample
+const float PERCENT_PER_CM = 100.0 / (MAX_DISTANCE - MIN_DISTANCE);
+
 NewPing sonar(TRIGGER_PIN, ECHO_PIN, MAX_DISTANCE);
 
 int prev_pump_state = 0;
 
+// Readings go out every SAMPLE_PERIOD_MS on a millis() schedule, so the time
+// spent pinging and printing does not add up as drift
+const unsigned long SAMPLE_PERIOD_MS = 500;
+unsigned long next_sample_ms = 0;
+
 const bool RELAY_ACTIVE_HIGH = true;
 
 void setup() {
@@ -27,6 +35,20 @@ void setup() {
 }
 
 void loop() {
+	// Pump commands are handled as soon as they arrive, not once per sample
+	if (Serial.available() > 0) {
+		char command = Serial.read();
+		controlPump(command);
+	}
+
+	unsigned long now = millis();
+	if ((long)(now - next_sample_ms) < 0) return;
+	next_sample_ms += SAMPLE_PERIOD_MS;
+	if ((long)(now - next_sample_ms) >= 0) {
+		// Fell a whole period behind; restart the schedule instead of bursting
+		next_sample_ms = now + SAMPLE_PERIOD_MS;
+	}
+
 	float level = getLevelPercent();
 
 	Serial.print(level);
@@ -43,16 +65,13 @@ void loop() {
 	// }
 	// else Serial.print(prev_pump_state);
 	Serial.print("\n");
-
-	if (Serial.available() > 0) {
-		char command = Serial.read();
-		controlPump(command);
-	}
-	
-	delay(500);
 }
 
 void controlPump(char cmd) {
+	// Only touch the pins when the pump state actually changes (a repeated
+	// command can still arrive, e.g. from a manual serial session)
+	if (cmd == '0' + prev_pump_state) return;
+
 	if (cmd == '0') { 
 		// OFF
 		digitalWrite(RELAY_PIN, RELAY_ACTIVE_HIGH ? LOW : HIGH);
@@ -75,5 +94,5 @@ float getLevelPercent() {
 	if (distance <= MIN_DISTANCE) return 100;
 	if (distance >= MAX_DISTANCE) return 0;
 
-	return ((float)(MAX_DISTANCE - distance) / (MAX_DISTANCE - MIN_DISTANCE)) * 100.0;
+	return (MAX_DISTANCE - distance) * PERCENT_PER_CM;
 }
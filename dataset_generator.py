@@ -1,9 +1,16 @@
 import pandas as pd
 import numpy as np
 import datetime
-import random
 import os
 
+try:
+    from numba import njit
+except ImportError:  # numba is optional; without it the simulation runs as plain Python
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
 # --- Simulation Parameters ---
 TANK_CAPACITY_LITRES = 1000.0
 PUMP_ON_THRESHOLD = 10.0  # Pump turns ON when water level is at or below this percentage
@@ -24,15 +31,36 @@ SENSOR_STUCK_PROBABILITY = 0.001  # 0.1% chance the sensor gets stuck
 EXTERNAL_FILL_PROBABILITY = 0.0005  # Very rare event for external tanker fill
 
 
-def get_water_usage(hour, is_weekend):
-    """Simulates more realistic water usage based on the time of day and day of the week."""
+# Per-tick random draws, pre-generated in bulk so the simulation kernel only
+# does arithmetic. Each column is a uniform sample in [0, 1).
+(R_NIGHT_USAGE, R_USAGE_BASE, R_USAGE_SCALE, R_LEAK_DROP, R_PEAK, R_PEAK_AMOUNT, R_GLITCH, R_GLITCH_VALUE,
+ R_STUCK, R_STUCK_TICKS, R_FILL, R_FILL_AMOUNT, R_LEAK_NIGHT) = range(13)
+N_RANDOM_DRAWS = 13
+
+# Simulation events, logged by the driver after the kernel has run. Their
+# column order matches the order in which they happen within a tick.
+EV_LEAK_NIGHT, EV_PEAK, EV_GLITCH, EV_STUCK, EV_UNSTUCK, EV_FILL = range(6)
+N_EVENTS = 6
+
+
+@njit(cache=True)
+def _uniform(u, low, high):
+    return low + (high - low) * u
+
+
+@njit(cache=True)
+def get_water_usage(hour, is_weekend, u_event, u_base, u_scale):
+    """Simulates more realistic water usage based on the time of day and day of the week.
+
+    u_event, u_base and u_scale are uniform [0, 1) draws.
+    """
 
     # --- Night Time: Very low to zero usage ---
     if 0 <= hour <= 5:
         # Most of the time, there is zero usage at night.
         # Add a small chance for a quick, small usage event (e.g., toilet flush).
-        if random.random() < 0.05:  # 5% chance of a small usage event
-            return np.random.uniform(0.5, 1.0)
+        if u_event < 0.05:  # 5% chance of a small usage event
+            return _uniform(u_base, 0.5, 1.0)
         else:
             return 0.0  # Absolutely no usage
 
@@ -40,50 +68,50 @@ def get_water_usage(hour, is_weekend):
     if is_weekend:
         # Weekend: Usage starts later and is more spread out
         if 8 <= hour <= 11:  # Morning activity
-            base_usage = np.random.uniform(0.8, 2.5)
+            base_usage = _uniform(u_base, 0.8, 2.5)
         elif 12 <= hour <= 20:  # Consistent daytime/evening usage
-            base_usage = np.random.uniform(0.6, 2.2)
+            base_usage = _uniform(u_base, 0.6, 2.2)
         elif 21 <= hour <= 23:  # Tapering off
-            base_usage = np.random.uniform(0.2, 1.0)
+            base_usage = _uniform(u_base, 0.2, 1.0)
         else:  # Early morning before activity starts (6-7 AM)
-            base_usage = np.random.uniform(0.1, 0.5)
+            base_usage = _uniform(u_base, 0.1, 0.5)
     else:
         # Weekday: Distinct morning and evening peaks
         if 6 <= hour <= 9:  # Morning rush
-            base_usage = np.random.uniform(1.5, 4.0)
+            base_usage = _uniform(u_base, 1.5, 4.0)
         elif 10 <= hour <= 17:  # Lower daytime usage (work/school hours)
-            base_usage = np.random.uniform(0.3, 1.2)
+            base_usage = _uniform(u_base, 0.3, 1.2)
         elif 18 <= hour <= 22:  # Evening peak (cooking, cleaning)
-            base_usage = np.random.uniform(1.2, 3.5)
+            base_usage = _uniform(u_base, 1.2, 3.5)
         else:  # Late evening
-            base_usage = np.random.uniform(0.1, 0.5)
+            base_usage = _uniform(u_base, 0.1, 0.5)
 
-    return base_usage * np.random.uniform(0.8, 1.2)  # Add some natural randomness
+    return base_usage * _uniform(u_scale, 0.8, 1.2)  # Add some natural randomness
 
 
-def generate_dataset(simulation_duration_days):
-    """Generates the entire dataset with anomalies for a given duration."""
-
-    time_now = START_DATE
-    end_time = START_DATE + datetime.timedelta(days=simulation_duration_days)
-
-    data = []
+@njit(cache=True)
+def _simulate(hours, minutes, is_weekend, rand, out_level, out_pump, out_volume, out_signal, out_leak, out_events):
+    """Runs the tank simulation, one tick per row of rand, into the preallocated outputs.
 
+    out_events[i, EV_*] is set to the event's value when it happens at tick i
+    and left untouched otherwise.
+    """
     # Initialize state
     water_level = 85.0  # Start with a reasonably full tank
     pump_state = 0  # Pump is initially off
     is_leaking_tonight = False
-    sensor_stuck_at = None
+    sensor_stuck_at = 0.0
     sensor_stuck_counter = 0
 
-    print(f"Generating dataset for {simulation_duration_days} days...")
+    for i in range(len(hours)):
+        hour = hours[i]
+        r = rand[i]
 
-    while time_now < end_time:
         # Check if it's a new day to decide if a leak should happen tonight
-        if time_now.hour == 0 and time_now.minute == 0:
-            is_leaking_tonight = random.random() < LEAK_NIGHT_PROBABILITY
+        if hour == 0 and minutes[i] == 0:
+            is_leaking_tonight = r[R_LEAK_NIGHT] < LEAK_NIGHT_PROBABILITY
             if is_leaking_tonight:
-                print(f"INFO: Simulating a leak for the night of {time_now.date()}")
+                out_events[i, EV_LEAK_NIGHT] = 1.0
 
         # --- Determine Targets for the CURRENT state ---
 
@@ -97,20 +125,15 @@ def generate_dataset(simulation_duration_days):
             pump_signal_target = pump_state
 
         # Target 2: Leak Detection Activation Logic
-        is_leak_window = LEAK_DETECTION_START_HOUR <= time_now.hour < LEAK_DETECTION_END_HOUR
-        leak_detection_target = 1 if is_leak_window else 0
+        is_leak_window = LEAK_DETECTION_START_HOUR <= hour < LEAK_DETECTION_END_HOUR
 
         # --- Record Current State ---
 
-        current_record = {
-            'timestamp': time_now.strftime('%Y-%m-%dT%H:%M:%S') + 'Z',
-            'water_level_percent': round(water_level, 2),
-            'pump_state': pump_state,
-            'water_volume_litres': round(water_level / 100 * TANK_CAPACITY_LITRES, 0),
-            'pump_signal_target': pump_signal_target,
-            'leak_detection_active_target': leak_detection_target
-        }
-        data.append(current_record)
+        out_level[i] = round(water_level, 2)
+        out_pump[i] = pump_state
+        out_volume[i] = round(water_level / 100 * TANK_CAPACITY_LITRES, 0)
+        out_signal[i] = pump_signal_target
+        out_leak[i] = 1 if is_leak_window else 0
 
         # --- Update State for the NEXT Interval ---
 
@@ -119,58 +142,114 @@ def generate_dataset(simulation_duration_days):
             water_level += PUMP_FILL_RATE_PERCENT_PER_TICK
 
         # 2. Apply normal usage
-        is_weekend = time_now.weekday() >= 5  # Saturday or Sunday
-        usage = get_water_usage(time_now.hour, is_weekend)
-        water_level -= usage
+        water_level -= get_water_usage(hour, is_weekend[i], r[R_NIGHT_USAGE], r[R_USAGE_BASE], r[R_USAGE_SCALE])
 
         # 3. Apply leak if active
         if is_leak_window and is_leaking_tonight:
-            water_level -= np.random.uniform(0.1, 0.3)  # Slow, consistent drop
+            water_level -= _uniform(r[R_LEAK_DROP], 0.1, 0.3)  # Slow, consistent drop
 
         # 4. Inject Anomalies
 
         # Sudden Usage Peak
-        if random.random() < USAGE_PEAK_PROBABILITY:
-            water_level -= np.random.uniform(10, 20)
-            print(f"ANOMALY: Sudden usage peak at {time_now}")
+        if r[R_PEAK] < USAGE_PEAK_PROBABILITY:
+            water_level -= _uniform(r[R_PEAK_AMOUNT], 10, 20)
+            out_events[i, EV_PEAK] = 1.0
 
         # Sensor Glitch
-        if random.random() < SENSOR_GLITCH_PROBABILITY:
-            glitch_value = np.random.uniform(0, 100)
-            glitch_record = current_record.copy()
-            glitch_record['water_level_percent'] = round(glitch_value, 2)
-            data[-1] = glitch_record
-            print(f"ANOMALY: Sensor glitch at {time_now}, reading: {glitch_value:.2f}%")
+        if r[R_GLITCH] < SENSOR_GLITCH_PROBABILITY:
+            glitch_value = _uniform(r[R_GLITCH_VALUE], 0, 100)
+            out_level[i] = round(glitch_value, 2)
+            out_events[i, EV_GLITCH] = glitch_value
 
         # Stuck Sensor
-        if sensor_stuck_at is not None:
-            data[-1]['water_level_percent'] = sensor_stuck_at
+        if sensor_stuck_counter > 0:
+            out_level[i] = sensor_stuck_at
             sensor_stuck_counter -= 1
             if sensor_stuck_counter <= 0:
-                sensor_stuck_at = None
-                print(f"INFO: Sensor unstuck at {time_now}")
-        elif random.random() < SENSOR_STUCK_PROBABILITY:
+                out_events[i, EV_UNSTUCK] = 1.0
+        elif r[R_STUCK] < SENSOR_STUCK_PROBABILITY:
             sensor_stuck_at = round(water_level, 2)
-            sensor_stuck_counter = random.randint(5, 12)
-            print(f"ANOMALY: Sensor stuck at {sensor_stuck_at}% starting at {time_now}")
+            sensor_stuck_counter = 5 + int(r[R_STUCK_TICKS] * 8)  # 5..12 ticks
+            out_events[i, EV_STUCK] = sensor_stuck_at
 
         # External Fill Event
-        if random.random() < EXTERNAL_FILL_PROBABILITY and pump_state == 0:
-            fill_amount = np.random.uniform(30, 60)
+        if r[R_FILL] < EXTERNAL_FILL_PROBABILITY and pump_state == 0:
+            fill_amount = _uniform(r[R_FILL_AMOUNT], 30, 60)
             water_level += fill_amount
-            print(f"ANOMALY: External fill event of {fill_amount:.2f}% at {time_now}")
+            out_events[i, EV_FILL] = fill_amount
 
         # 5. Ensure water level is within bounds
-        water_level = max(0, min(100, water_level))
+        water_level = max(0.0, min(100.0, water_level))
 
         # 6. Update the pump state for the next iteration based on the target we calculated
         pump_state = pump_signal_target
 
-        # Move time forward
-        time_now += datetime.timedelta(minutes=TIME_INTERVAL_MINUTES)
+
+def _log_events(times, events):
+    """Prints the INFO/ANOMALY lines for the events recorded by _simulate."""
+    for i, kind in np.argwhere(~np.isnan(events)):
+        time_now = times[i].astype(datetime.datetime)
+        value = events[i, kind]
+        if kind == EV_LEAK_NIGHT:
+            print(f"INFO: Simulating a leak for the night of {time_now.date()}")
+        elif kind == EV_PEAK:
+            print(f"ANOMALY: Sudden usage peak at {time_now}")
+        elif kind == EV_GLITCH:
+            print(f"ANOMALY: Sensor glitch at {time_now}, reading: {value:.2f}%")
+        elif kind == EV_STUCK:
+            print(f"ANOMALY: Sensor stuck at {value}% starting at {time_now}")
+        elif kind == EV_UNSTUCK:
+            print(f"INFO: Sensor unstuck at {time_now}")
+        elif kind == EV_FILL:
+            print(f"ANOMALY: External fill event of {value:.2f}% at {time_now}")
+
+
+def generate_dataset(simulation_duration_days):
+    """Generates the entire dataset with anomalies for a given duration."""
+
+    n_ticks = int(simulation_duration_days * 24 * 60 // TIME_INTERVAL_MINUTES)
+    times = np.datetime64(START_DATE, 's') + np.arange(n_ticks) * np.timedelta64(TIME_INTERVAL_MINUTES, 'm')
+
+    print(f"Generating dataset for {simulation_duration_days} days...")
+
+    days = times.astype('datetime64[D]')
+    minute_of_day = (times - days).astype('timedelta64[m]').astype(np.int64)
+    hours = minute_of_day // 60
+    minutes = minute_of_day % 60
+    is_weekend = (days.astype(np.int64) + 3) % 7 >= 5  # Saturday or Sunday (1970-01-01 was a Thursday)
+    rand = np.random.default_rng().random((n_ticks, N_RANDOM_DRAWS))
+
+    water_level = np.empty(n_ticks, dtype=np.float32)
+    pump_state = np.empty(n_ticks, dtype=np.int8)
+    water_volume = np.empty(n_ticks, dtype=np.float32)
+    pump_signal = np.empty(n_ticks, dtype=np.int8)
+    leak_detection = np.empty(n_ticks, dtype=np.int8)
+    events = np.full((n_ticks, N_EVENTS), np.nan)
+
+    _simulate(hours, minutes, is_weekend, rand, water_level, pump_state, water_volume, pump_signal, leak_detection, events)
+    _log_events(times, events)
 
     print("Dataset generation complete.")
-    return pd.DataFrame(data)
+    return pd.DataFrame({
+        'timestamp': np.datetime_as_string(times, unit='s', timezone='UTC'),  # e.g. 2025-10-01T00:15:00Z
+        'water_level_percent': water_level,
+        'pump_state': pump_state,
+        'water_volume_litres': water_volume,
+        'pump_signal_target': pump_signal,
+        'leak_detection_active_target': leak_detection,
+    })
+
+
+def save_dataset(df, path):
+    """Writes the dataset as CSV, or as zstd-compressed Parquet when path ends in .parquet.
+
+    CSV stays on pandas so files match the existing data/*.csv byte for byte
+    (whole floats keep their ".0", so columns read back with the same dtypes).
+    """
+    if path.endswith('.parquet'):
+        df.to_parquet(path, index=False, compression='zstd')
+        return
+    df.to_csv(path, index=False)
 
 
 # --- Main Execution ---
@@ -192,12 +271,12 @@ if __name__ == "__main__":
         os.makedirs(output_directory)
         print(f"Created directory: '{output_directory}'")
 
-    file_name_input = input("Enter the file name for the CSV (without extension): ")
-    output_filename = file_name_input + ".csv"
+    file_name_input = input("Enter the file name for the CSV (without extension, or ending in .parquet): ")
+    output_filename = file_name_input if file_name_input.endswith(".parquet") else file_name_input + ".csv"
     full_path = os.path.join(output_directory, output_filename)
 
-    generated_df.to_csv(full_path, index=False)
+    save_dataset(generated_df, full_path)
 
     print(f"\nSuccessfully generated '{full_path}' with {len(generated_df)} rows.")
-    print("Script finished. The CSV file is ready.")
+    print("Script finished. The dataset file is ready.")
 
@@ -5,7 +5,7 @@ import Dashboard from "../components/Dashboard";
 import LoginCard from "../components/LoginCard";
 import {
   ApiError,
-  BasicCreds,
+  Credentials,
   DashboardMetrics,
   TelemetrySample,
   clearCredentials,
@@ -32,7 +32,7 @@ const initialState: DashboardState = {
 };
 
 export default function Home() {
-  const [creds, setCreds] = useState<BasicCreds | null>(null);
+  const [creds, setCreds] = useState<Credentials | null>(null);
   const [state, setState] = useState<DashboardState>(initialState);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
@@ -52,7 +52,7 @@ export default function Home() {
   }, []);
 
   const refresh = useCallback(
-    async (currentCreds: BasicCreds | null, showSpinner = false) => {
+    async (currentCreds: Credentials | null, showSpinner = false) => {
       if (!currentCreds) return;
       setError(null);
       if (showSpinner) setLoading(true);
@@ -64,6 +64,22 @@ export default function Home() {
         setState({ metrics, history });
       } catch (err) {
         if (err instanceof ApiError && err.status === 401) {
+          if (currentCreds.token) {
+            // Tokens expire, and a backend restart without WATERTANK_SECRET_KEY
+            // invalidates them; sign in again once with the stored credentials
+            try {
+              const { token } = await login({
+                username: currentCreds.username,
+                password: currentCreds.password,
+              });
+              const nextCreds = { ...currentCreds, token };
+              persistCredentials(nextCreds);
+              setCreds(nextCreds);
+              return;
+            } catch (loginErr) {
+              // fall through to the logout below
+            }
+          }
           logout();
           setError("Session expired. Please sign in again.");
           return;
@@ -91,8 +107,8 @@ export default function Home() {
 
   const performLogin = useCallback(
     async (username: string, password: string) => {
-      await login({ username, password });
-      const nextCreds = { username, password };
+      const { token } = await login({ username, password });
+      const nextCreds = { username, password, token };
       persistCredentials(nextCreds);
       setCreds(nextCreds);
       await refresh(nextCreds, false);
@@ -1,6 +1,7 @@
-export type BasicCreds = {
+export type Credentials = {
   username: string;
   password: string;
+  token?: string;
 };
 
 const API_BASE =
@@ -13,7 +14,11 @@ function encodeBase64(text: string): string {
   return Buffer.from(text).toString("base64");
 }
 
-function basicAuthHeader(creds: BasicCreds): string {
+function authHeader(creds: Credentials): string {
+  if (creds.token) {
+    // Signed token from /users/login; verified without bcrypt on the backend
+    return `Bearer ${creds.token}`;
+  }
   const token = encodeBase64(`${creds.username}:${creds.password}`);
   return `Basic ${token}`;
 }
@@ -43,8 +48,13 @@ async function handleJson<T>(response: Response): Promise<T> {
 }
 
 export async function login(
-  creds: BasicCreds
-): Promise<{ username: string; last_login: string | null }> {
+  creds: Credentials
+): Promise<{
+  username: string;
+  last_login: string | null;
+  token: string;
+  token_type: string;
+}> {
   const response = await fetch(`${API_BASE}/users/login`, {
     method: "POST",
     headers: {
@@ -56,7 +66,7 @@ export async function login(
 }
 
 export async function register(
-  creds: BasicCreds
+  creds: Credentials
 ): Promise<{ message: string; username: string }> {
   const response = await fetch(`${API_BASE}/users/register`, {
     method: "POST",
@@ -76,22 +86,22 @@ export interface TelemetrySample {
   raw_payload: string;
 }
 
-export async function fetchLatest(creds: BasicCreds): Promise<TelemetrySample> {
+export async function fetchLatest(creds: Credentials): Promise<TelemetrySample> {
   const response = await fetch(`${API_BASE}/telemetry/latest`, {
     headers: {
-      authorization: basicAuthHeader(creds),
+      authorization: authHeader(creds),
     },
   });
   return handleJson(response);
 }
 
 export async function fetchHistory(
-  creds: BasicCreds,
+  creds: Credentials,
   limit = 50
 ): Promise<TelemetrySample[]> {
   const response = await fetch(`${API_BASE}/telemetry/history?limit=${limit}`, {
     headers: {
-      authorization: basicAuthHeader(creds),
+      authorization: authHeader(creds),
     },
   });
   return handleJson(response);
@@ -130,17 +140,17 @@ export interface DashboardMetrics {
 }
 
 export async function fetchMetrics(
-  creds: BasicCreds
+  creds: Credentials
 ): Promise<DashboardMetrics> {
   const response = await fetch(`${API_BASE}/dashboard/metrics`, {
     headers: {
-      authorization: basicAuthHeader(creds),
+      authorization: authHeader(creds),
     },
   });
   return handleJson(response);
 }
 
-export function persistCredentials(creds: BasicCreds): void {
+export function persistCredentials(creds: Credentials): void {
   if (typeof window === "undefined") return;
   localStorage.setItem("water-tank-creds", JSON.stringify(creds));
 }
@@ -150,12 +160,12 @@ export function clearCredentials(): void {
   localStorage.removeItem("water-tank-creds");
 }
 
-export function loadCredentials(): BasicCreds | null {
+export function loadCredentials(): Credentials | null {
   if (typeof window === "undefined") return null;
   const raw = localStorage.getItem("water-tank-creds");
   if (!raw) return null;
   try {
-    const parsed = JSON.parse(raw) as BasicCreds;
+    const parsed = JSON.parse(raw) as Credentials;
     if (!parsed.username || !parsed.password) return null;
     return parsed;
   } catch (error) {
@@ -1,4 +1,5 @@
 import sys
+import warnings
 import joblib
 import numpy as np
 import pandas as pd
@@ -7,6 +8,9 @@ from pathlib import Path
 MODEL_FILE = Path('model') / 'aqua_man_model.pkl'
 SCALER_FILE = Path('model') / 'aqua_man_scaler.pkl'
 
+# The scaler was fitted on a DataFrame; feeding it a plain ndarray in the same column order is intended.
+warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
 
 def main():
     # Load model
@@ -26,62 +30,56 @@ def main():
     # Use the training input columns only (keep it simple)
     feature_names = ['timestamp', 'water_level_percent', 'pump_state', 'water_volume_litres']
 
-    # Create a small random DataFrame (20 rows)
+    # Build the input matrix directly in NumPy (20 rows), one column per feature
     rng = np.random.RandomState(42)
     n_rows = 20
-    X = pd.DataFrame({f: rng.rand(n_rows) for f in feature_names})
+    col = {f: j for j, f in enumerate(feature_names)}
+    X_arr = np.empty((n_rows, len(feature_names)), dtype=np.float64)
+    # Consume the draws of the random placeholder table this script used to
+    # start from, so the seeded sample stays the same as before
+    rng.rand(len(feature_names) * n_rows)
 
-    # Generate a simple timestamp range (15-minute steps ending now UTC)
+    # Generate a simple timestamp range (15-minute steps ending now UTC) as numeric epoch seconds
     ts = pd.date_range(end=pd.Timestamp.utcnow(), periods=n_rows, freq='15min')
-    # Use numeric epoch seconds if 'timestamp' is a feature
-    epoch_seconds = (ts.astype('int64') // 10**9).astype(float)
-
-    # If the model directly expects a numeric 'timestamp' or '*epoch*' feature
-    if 'timestamp' in feature_names:
-        X['timestamp'] = epoch_seconds.values
-    for f in feature_names:
-        if 'epoch' in f.lower() and f != 'timestamp':
-            X[f] = epoch_seconds.values
-
-    # Use realistic ranges for known features
-    if 'water_level_percent' in feature_names:
-        X['water_level_percent'] = rng.uniform(0.0, 100.0, n_rows)
-    if 'water_volume_litres' in feature_names:
-        X['water_volume_litres'] = rng.uniform(0.0, 1000.0, n_rows)
-
-    # Keep binary-like columns as 0/1 when named like 'state' or 'signal'
-    for f in feature_names:
-        fl = f.lower()
-        if fl.endswith(('state', 'signal')):
-            X[f] = (rng.rand(n_rows) > 0.5).astype(int)
+    X_arr[:, col['timestamp']] = ts.as_unit('s').asi8
+
+    # Use realistic ranges for known features; pump_state stays binary 0/1
+    X_arr[:, col['water_level_percent']] = rng.uniform(0.0, 100.0, n_rows)
+    X_arr[:, col['water_volume_litres']] = rng.uniform(0.0, 1000.0, n_rows)
+    X_arr[:, col['pump_state']] = rng.rand(n_rows) > 0.5
+
+    # DataFrame view of the same data for the scaler's named columns and the diagnostics
+    X = pd.DataFrame(X_arr, columns=feature_names, copy=False)
 
     # Prepare input matrix to match model/scaler expectations (keep it simple)
     X_use = X
-    expected_n = getattr(model, 'n_features_in_', X.shape[1])
+    expected_n = getattr(model, 'n_features_in_', X_arr.shape[1])
     scaler_used = False
 
     if scaler is not None and hasattr(scaler, 'feature_names_in_'):
         scaler_features = list(scaler.feature_names_in_)
-        if all(f in X.columns for f in scaler_features):
+        if all(f in col for f in scaler_features):
+            # Gather the columns into the scaler's order in one copy
             X_use = X[scaler_features]
+            X_raw = X_arr[:, [col[f] for f in scaler_features]]
         else:
-            X_use = X
+            X_raw = X_arr
         try:
-            X_in = scaler.transform(X_use)
+            X_in = scaler.transform(X_raw)
             scaler_used = True
         except Exception as e:
             print(f"Warning: Failed to apply scaler, proceeding with raw values. Reason: {e}")
             # Fallback to raw values
-            X_in = X_use.values
+            X_in = X_raw
             scaler_used = False
     else:
         # No scaler or no feature names: use a minimal subset if needed
-        if expected_n == X.shape[1]:
-            X_in = X.values
-        elif expected_n == 1 and 'water_level_percent' in X.columns:
-            X_in = X[['water_level_percent']].values
+        if expected_n == X_arr.shape[1]:
+            X_in = X_arr
+        elif expected_n == 1:
+            X_in = X_arr[:, [col['water_level_percent']]]
         else:
-            X_in = X.iloc[:, :expected_n].values
+            X_in = X_arr[:, :expected_n]
         scaler_used = False
 
     # Diagnostics before prediction